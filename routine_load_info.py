@@ -1,205 +1,395 @@
 import pymysql
+import pymysql.cursors
+from pymysql.constants import CLIENT
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import chain
+import queue
 import re
 import json
+import logging
+import threading
 
-def get_mysql_connection(host, user, password, port=3306, db=None):
+try:
+    # orjson parses Progress several times faster, fall back to stdlib json if not installed
+    import orjson as _json
+except ImportError:
+    _json = json
+
+logger = logging.getLogger(__name__)
+
+# Idle connections kept per (host, user, port, multi_statements); extra connections are closed on release
+POOL_MAX_IDLE = 10
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+# Worker threads for per-db / per-routine-load queries
+MAX_WORKERS = 16
+
+# Same rows as show routine load in every db, filtered by table in FE
+_ROUTINE_LOAD_JOB_SQL = """
+select JOB_NAME, DB_NAME, TABLE_NAME, PROGRESS
+from information_schema.routine_load_job
+where TABLE_NAME = %s and STATE not in ('STOPPED', 'CANCELLED') ;
+"""
+
+_SPLIT_RE = re.compile(r'\);\s*')
+# kafka_offsets, CREATE ROUTINE LOAD header and group.id in one alternation, so patch_create_sql scans the SQL once
+_PATCH_OFFSETS_HDR = (
+    r'(?P<offsets>kafka_offsets"\s*=\s*"[0-9,\s]*")'
+    r'|(?P<hdr>(?i:(?P<hdr_pre>CREATE\s+ROUTINE\s+LOAD\s+)\w+(?P<hdr_post>\s+ON\s+)))'
+)
+_PATCH_ALL_RE = re.compile(_PATCH_OFFSETS_HDR + r'|(?P<grp>"property\.group\.id"\s*=\s*"(?P<grp_value>[^"]+)")')
+# Used when create_sql has no "property.group.id", so the group.id branch is not tried at every position
+_PATCH_NO_GROUP_ID_RE = re.compile(_PATCH_OFFSETS_HDR)
+
+def _get_pool(key):
+    """
+    Return the idle-connection queue for key (host, user, port, multi_statements), create it lazily
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = {}
+        if key not in _POOL:
+            _POOL[key] = queue.LifoQueue(maxsize=POOL_MAX_IDLE)
+        return _POOL[key]
+
+def get_mysql_connection(host, user, password, port=3306, db=None, multi_statements=False):
     """
-    Establish MySQL connection
+    Get MySQL connection from pool, establish a new one if no idle connection
+    multi_statements: allow several ;-separated statements in one execute
+    Use release_connection to return it to pool
     """
+    key = (host, user, port, multi_statements)
+    pool = _get_pool(key)
     conn = None
     try:
-        conn = pymysql.connect(
-            host=host,
-            user=user,
-            password=password,
-            port=port,
-            db=db,
-            charset='utf8mb4'
-        )
-    except Exception as e:
-        print(f"Failed to connect to MySQL: {e}")
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = pymysql.connect(
+                host=host,
+                user=user,
+                password=password,
+                port=port,
+                charset='utf8mb4',
+                client_flag=CLIENT.MULTI_STATEMENTS if multi_statements else 0
+            )
+            # pymysql normalizes empty host/user, so remember the key we got it under
+            conn._pool_key = key
+            conn._current_db = None
+        if db and db != conn._current_db:
+            conn.select_db(db)
+            conn._current_db = db
+    except pymysql.MySQLError as e:
+        logger.error("Failed to connect to MySQL: %s", e)
+        if conn and conn.open:
+            conn.close()
+        conn = None
     return conn
 
-def fetch_table_schemas(host, user, password, port=3306):
+def release_connection(conn):
     """
-    Execute SQL and return result list
+    Return connection to pool, close it if pool is full
+    """
+    if not conn.open:
+        return
+    pool = _get_pool(conn._pool_key)
+    try:
+        pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def fetch_table_schemas(host, user, password, port=3306, only_db=None):
     """
-    sql = """
-    select table_schema 
-    from information_schema.tables 
-    where table_schema not in ('mysql','information_schema','__internal_schema') 
-    group by table_schema ;
+    Execute SQL and return result list
+    If only_db is given, only check that schema
     """
+    if only_db:
+        sql = """
+        select distinct table_schema
+        from information_schema.tables
+        where table_schema = %s ;
+        """
+        args = (only_db,)
+    else:
+        sql = """
+        select table_schema 
+        from information_schema.tables 
+        where table_schema not in ('mysql','information_schema','__internal_schema') 
+        group by table_schema ;
+        """
+        args = None
     result_list = []
     conn = get_mysql_connection(host, user, password, port)
     if conn:
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(sql)
-                rows = cursor.fetchall()
-                result_list = [row[0] for row in rows]
-        except Exception as e:
-            print(f"Failed to execute SQL: {e}")
+            with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+                cursor.execute(sql, args)
+                result_list = [row[0] for row in cursor]
+        except pymysql.MySQLError as e:
+            logger.error("Failed to execute SQL: %s", e)
         finally:
-            conn.close()
+            release_connection(conn)
     return result_list
 
+@lru_cache(maxsize=1024)
 def clean_dbname(dbname):
     """
     Remove 'default_cluster:' prefix if exists
     """
     if dbname and isinstance(dbname, str):
         if dbname.startswith("default_cluster:"):
-            return dbname.split(":", 1)[1]
+            return dbname[len("default_cluster:"):]
     return dbname
 
+def _fetch_one_db(host, user, password, port, db, filter_table=None):
+    """
+    Use db, execute show routine load; get Name,DbName,TableName,Progress fields
+    Return: (db, [dict1, dict2, ...])
+    """
+    conn = get_mysql_connection(host, user, password, port, db=db)
+    db_result = []
+    if conn:
+        try:
+            with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+                cursor.execute("show routine load;")
+                columns = [desc[0] for desc in cursor.description]
+                name_idx, dbname_idx, tablename_idx, progress_idx = (
+                    columns.index(c) for c in ('Name', 'DbName', 'TableName', 'Progress'))
+                for row in cursor:
+                    if filter_table and row[tablename_idx] != filter_table:
+                        continue
+                    db_result.append({
+                        'Name': row[name_idx],
+                        'DbName': clean_dbname(row[dbname_idx]),
+                        'TableName': row[tablename_idx],
+                        'Progress': row[progress_idx],
+                    })
+        except pymysql.MySQLError as e:
+            logger.error("Failed to execute show routine load in db %s: %s", db, e)
+        except ValueError as e:
+            # Name/DbName/TableName/Progress column missing in show routine load result
+            logger.error("Unexpected show routine load columns in db %s: %s", db, e)
+        finally:
+            release_connection(conn)
+    return db, db_result
+
+def _fetch_by_table(host, user, password, port, table):
+    """
+    Get routine loads of table in all dbs with one query on information_schema.routine_load_job
+    Return: {db: [dict1, dict2, ...]}, or None if the table does not exist (Doris before 3.0)
+    """
+    conn = get_mysql_connection(host, user, password, port)
+    if not conn:
+        return None
+    result = defaultdict(list)
+    try:
+        with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(_ROUTINE_LOAD_JOB_SQL, (table,))
+            for name, dbname, tablename, progress in cursor:
+                dbname = clean_dbname(dbname)
+                result[dbname].append({
+                    'Name': name,
+                    'DbName': dbname,
+                    'TableName': tablename,
+                    'Progress': progress,
+                })
+    except pymysql.MySQLError as e:
+        logger.info("information_schema.routine_load_job not available, use show routine load: %s", e)
+        return None
+    finally:
+        release_connection(conn)
+    return result
+
 def fetch_routine_load_info(host, user, password, db_list, port=3306, filter_db=None, filter_table=None):
     """
-    Traverse db_list, use each db, execute show routine load; get Name,DbName,TableName,Progress fields
+    Traverse db_list in parallel, use each db, execute show routine load; get Name,DbName,TableName,Progress fields
+    With filter_table, filter in FE with one information_schema.routine_load_job query when it exists
     Support filter_db, filter_table, only get routine load for specified db/table
-    Return format: {db1: [dict1, dict2, ...], db2: [...], ...}
+    Return format: {db1: [dict1, dict2, ...], db2: [...], ...}, in db_list order
     """
+    fetched = _fetch_by_table(host, user, password, port, filter_table) if filter_table else None
+    if fetched is not None:
+        return {db: fetched[db] for db in db_list
+                if (not filter_db or db == filter_db) and fetched.get(db)}
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(_fetch_one_db, host, user, password, port, db, filter_table)
+                   for db in db_list if not filter_db or db == filter_db]
+        for future in as_completed(futures):
+            db, db_result = future.result()
+            fetched[db] = db_result
     result = {}
     for db in db_list:
-        if filter_db and db != filter_db:
-            continue
-        conn = get_mysql_connection(host, user, password, port, db=db)
-        db_result = []
-        if conn:
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("show routine load;")
-                    columns = [desc[0] for desc in cursor.description]
-                    rows = cursor.fetchall()
-                    for row in rows:
-                        row_dict = dict(zip(columns, row))
-                        filtered = {k: row_dict.get(k) for k in ['Name', 'DbName', 'TableName', 'Progress']}
-                        filtered['DbName'] = clean_dbname(filtered.get('DbName'))
-                        if filter_table and filtered.get('TableName') != filter_table:
-                            continue
-                        db_result.append(filtered)
-            except Exception as e:
-                print(f"Failed to execute show routine load in db {db}: {e}")
-            finally:
-                conn.close()
-        if db_result:
-            result[db] = db_result
+        if fetched.get(db):
+            result[db] = fetched[db]
     return result
 
 def get_dbtable_to_names(routine_load_infos):
     """
-    Count all Names for each DbName.TableName
-    routine_load_infos: {db1: [dict1, dict2, ...], db2: [...], ...}
-    Return: { "DbName.TableName": set([Name1, Name2, ...]), ... }
+    Count all Names for each (DbName, TableName)
+    routine_load_infos: {db1: [dict1, dict2, ...], db2: [...], ...}, DbName already cleaned
+    Return: { (DbName, TableName): set([Name1, Name2, ...]), ... }
     """
-    dbtable_to_names = {}
-    for db, info_list in routine_load_infos.items():
-        for item in info_list:
-            dbname = clean_dbname(item.get('DbName'))
-            tablename = item.get('TableName')
-            name = item.get('Name')
-            if dbname and tablename and name:
-                key = f"{dbname}.{tablename}"
-                if key not in dbtable_to_names:
-                    dbtable_to_names[key] = set()
-                dbtable_to_names[key].add(name)
-    return dbtable_to_names
+    dbtable_to_names = defaultdict(set)
+    for item in chain.from_iterable(routine_load_infos.values()):
+        dbname = item['DbName']
+        tablename = item['TableName']
+        name = item['Name']
+        if dbname and tablename and name:
+            dbtable_to_names[(dbname, tablename)].add(name)
+    return dict(dbtable_to_names)
 
-def fetch_create_routine_load(host, user, password, port, db, routine_load_name):
+def fetch_create_routine_loads_batch(host, user, password, port, db, routine_load_names):
     """
-    Get create statement for specified routine load
-    show create routine load for db.routineloadName
-    Note: The third column is the create statement
+    Get create statements for routine loads in one db
+    Send all show create routine load statements in one round trip, read each result set with nextset
+    If a statement fails, get the rest one by one on the same connection
+    db must already be cleaned by clean_dbname
+    Return: {routine_load_name: create_sql}, routine loads without create statement are left out
     """
-    db_clean = clean_dbname(db)
-    conn = get_mysql_connection(host, user, password, port, db=db_clean)
-    create_sql = ""
+    names = list(routine_load_names)
+    conn = get_mysql_connection(host, user, password, port, db=db, multi_statements=True)
+    result = {}
     if conn:
         try:
             with conn.cursor() as cursor:
-                sql = f"show create routine load for {db_clean}.{routine_load_name}"
-                cursor.execute(sql)
-                row = cursor.fetchone()
-                if row:
-                    create_sql = row[2] if len(row) > 2 else (row[1] if len(row) > 1 else row[0])
-        except Exception as e:
-            print(f"Failed to get create statement for {db_clean}.{routine_load_name}: {e}")
+                i = 0
+                try:
+                    cursor.execute(";".join(f"show create routine load for {db}.{name}" for name in names))
+                    while i < len(names):
+                        create_sql = _create_sql_from_row(cursor.fetchone())
+                        if create_sql:
+                            result[names[i]] = create_sql
+                        i += 1
+                        if i < len(names) and not cursor.nextset():
+                            break
+                except pymysql.MySQLError as e:
+                    logger.warning("Failed to batch get create statements in db %s, get them one by one: %s", db, e)
+                for routine_load_name in names[i:]:
+                    try:
+                        cursor.execute(f"show create routine load for {db}.{routine_load_name}")
+                        create_sql = _create_sql_from_row(cursor.fetchone())
+                    except pymysql.MySQLError as e:
+                        logger.error("Failed to get create statement for %s.%s: %s", db, routine_load_name, e)
+                        continue
+                    if create_sql:
+                        result[routine_load_name] = create_sql
         finally:
-            conn.close()
-    return create_sql
+            release_connection(conn)
+    return result
+
+def _create_sql_from_row(row):
+    """
+    Pick the create statement out of a show create routine load row
+    Note: The third column is the create statement
+    """
+    if not row:
+        return ""
+    return row[2] if len(row) > 2 else (row[1] if len(row) > 1 else row[0])
 
-def replace_kafka_offsets(create_sql, progress_json):
+def _new_kafka_offsets(progress_json):
     """
-    Replace kafka_offsets in create_sql with offsets from progress_json, add 1 to each
+    Build kafka_offsets value from progress_json, add 1 to each
+    Return None if progress_json can not be used
     """
     try:
           # Check if progress_json is already a string (not JSON)
         if isinstance(progress_json, str) and not progress_json.startswith('{'):
-            print(f"Progress is a string, skipping kafka_offsets replacement: {progress_json}")
-            return create_sql
+            logger.info("Progress is a string, skipping kafka_offsets replacement: %s", progress_json)
+            return None
             
-        progress = json.loads(progress_json)
-        offsets = []
-        for k in sorted(progress.keys(), key=lambda x: int(x)):
-            v = int(progress[k]) + 1
-            offsets.append(str(v))
-        new_offsets = ", ".join(offsets)
-        def repl(m):
-            return f'kafka_offsets" = "{new_offsets}"'
-        create_sql_new = re.sub(r'kafka_offsets"\s*=\s*"[0-9,\s]*"', repl, create_sql)
-        return create_sql_new
-    except Exception as e:
-        print(f"Failed to replace kafka_offsets: {e}")
-        return create_sql
+        progress = _json.loads(progress_json)
+        items = [(int(k), int(v) + 1) for k, v in progress.items()]
+        items.sort()
+        return ", ".join(str(v) for _, v in items)
+    except (json.JSONDecodeError, ValueError, TypeError) as e:
+        logger.error("Failed to replace kafka_offsets: %s", e)
+        return None
 
-def patch_create_sql_dbname(create_sql, dbname, routinename):
+def split_sql_with_separator(sql):
     """
-    Replace CREATE ROUTINE LOAD routinename ON with CREATE ROUTINE LOAD dbname.routinename ON
+    Add separator after each );
     """
-    pattern = r'(CREATE\s+ROUTINE\s+LOAD\s+)(\w+)(\s+ON\s+)'
-    replacement = r'\1' + f'{dbname}.{routinename}' + r'\3'
-    create_sql = re.sub(pattern, replacement, create_sql, count=1)
-    return create_sql
+    return _SPLIT_RE.sub(');\n----------------------------------\n', sql)
 
-def patch_group_id(create_sql):
+def patch_create_sql(create_sql, dbname, routinename, progress_json):
     """
+    In a single scan of create_sql:
+    Replace kafka_offsets with offsets from progress_json, add 1 to each
+    Replace CREATE ROUTINE LOAD routinename ON with CREATE ROUTINE LOAD dbname.routinename ON
     Replace "property.group.id" = "xxx" with "property.group.id" = "xxx_new"
     """
+    new_offsets = _new_kafka_offsets(progress_json)
+    header_done = False
     def repl(m):
-        old_value = m.group(1)
+        nonlocal header_done
+        if m.group('offsets') is not None:
+            if new_offsets is None:
+                return m.group(0)
+            return f'kafka_offsets" = "{new_offsets}"'
+        if m.group('hdr') is not None:
+            if header_done:
+                return m.group(0)
+            header_done = True
+            return f"{m.group('hdr_pre')}{dbname}.{routinename}{m.group('hdr_post')}"
+        old_value = m.group('grp_value')
         if old_value.endswith("_new"):
             return m.group(0)
         return f'"property.group.id" = "{old_value}_new"'
-    create_sql = re.sub(r'"property\.group.id"\s*=\s*"([^"]+)"', repl, create_sql)
-    return create_sql
+    if '"property.group.id"' not in create_sql:
+        return _PATCH_NO_GROUP_ID_RE.sub(repl, create_sql)
+    return _PATCH_ALL_RE.sub(repl, create_sql)
 
-def split_sql_with_separator(sql):
+def fetch_all_create_routine_loads(host, user, password, port, routine_load_infos, filter_db=None, filter_table=None):
     """
-    Add separator after each );
+    Get create statements for all routine loads with Progress in routine_load_infos up front
+    Dbs are fetched in parallel, one connection and one batched round trip per db
+    filter_db, filter_table: only get create statements for specified db/table
+    Return: {(dbname, routine_load_name): create_sql}, routine loads without create statement are left out
     """
-    return re.sub(r'\);\s*', ');\n----------------------------------\n', sql)
+    db_to_names = defaultdict(list)
+    for db, info_list in routine_load_infos.items():
+        for item in info_list:
+            name = item.get('Name')
+            dbname = item.get('DbName')
+            if not (name and dbname and item.get('Progress')):
+                continue
+            if filter_db and dbname != filter_db:
+                continue
+            if filter_table and item.get('TableName') != filter_table:
+                continue
+            db_to_names[dbname].append(name)
+    result = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {dbname: executor.submit(fetch_create_routine_loads_batch, host, user, password, port, dbname, names)
+                   for dbname, names in db_to_names.items()}
+        for dbname, future in futures.items():
+            for name, create_sql in future.result().items():
+                result[(dbname, name)] = create_sql
+    return result
 
-def get_routine_load_create_sqls_with_offsets(host, user, password, port, routine_load_infos):
+def get_routine_load_create_sqls_with_offsets(host, user, password, port, routine_load_infos, filter_db=None, filter_table=None):
     """
     Get create statement for each routine load, replace kafka_offsets, patch dbname, patch group id
+    filter_db, filter_table: only get create statements for specified db/table
     Return: {db: {routine_load_name: create_sql}}
     """
+    create_sqls = fetch_all_create_routine_loads(host, user, password, port, routine_load_infos, filter_db, filter_table)
     result = {}
     for db, info_list in routine_load_infos.items():
         db_result = {}
         for item in info_list:
             name = item.get('Name')
-            dbname = clean_dbname(item.get('DbName'))
-            progress = item.get('Progress')
-            if not (name and dbname and progress):
-                continue
-            create_sql = fetch_create_routine_load(host, user, password, port, dbname, name)
+            dbname = item.get('DbName')
+            # Only routine loads chosen by fetch_all_create_routine_loads have a create statement
+            create_sql = create_sqls.get((dbname, name))
             if not create_sql:
                 continue
-            create_sql_new = replace_kafka_offsets(create_sql, progress)
-            create_sql_new = patch_create_sql_dbname(create_sql_new, dbname, name)
-            create_sql_new = patch_group_id(create_sql_new)
-            db_result[name] = create_sql_new
+            db_result[name] = patch_create_sql(create_sql, dbname, name, item.get('Progress'))
         if db_result:
             result[db] = db_result
     return result
@@ -207,27 +397,26 @@ def get_routine_load_create_sqls_with_offsets(host, user, password, port, routin
 def generate_pause_resume_sql(dbtable_to_names, filter_db=None, filter_table=None):
     """
     Generate PAUSE/RESUME ROUTINE LOAD statements
-    dbtable_to_names: { "DbName.TableName": set([Name1, Name2, ...]), ... }
+    dbtable_to_names: { (DbName, TableName): set([Name1, Name2, ...]), ... }
     filter_db, filter_table: only generate statements for specified db/table
-    Return: list of (dbtable, [names], [pause_sqls], [resume_sqls])
+    Return: list of ((db, table), [names], [pause_sqls], [resume_sqls])
     """
     result = []
-    for dbtable, names in dbtable_to_names.items():
-        db, table = dbtable.split('.', 1)
+    for (db, table), names in dbtable_to_names.items():
         if filter_db and db != filter_db:
             continue
         if filter_table and table != filter_table:
             continue
-        names_sorted = sorted(list(names))
-        pause_sqls = []
-        resume_sqls = []
-        for name in names_sorted:
-            pause_sqls.append(f"PAUSE ROUTINE LOAD FOR {db}.{name};")
-            resume_sqls.append(f"RESUME ROUTINE LOAD FOR {db}.{name};")
-        result.append((dbtable, names_sorted, pause_sqls, resume_sqls))
+        names_sorted = sorted(names)
+        prefix_p = "PAUSE ROUTINE LOAD FOR " + db + "."
+        prefix_r = "RESUME ROUTINE LOAD FOR " + db + "."
+        pause_sqls = [prefix_p + name + ";" for name in names_sorted]
+        resume_sqls = [prefix_r + name + ";" for name in names_sorted]
+        result.append(((db, table), names_sorted, pause_sqls, resume_sqls))
     return result
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     print("Please input MySQL connection info:")
     host = input("host: ")
     user = input("user: ")
@@ -245,15 +434,16 @@ def main():
     filter_db = filter_db if filter_db else None
     filter_table = filter_table if filter_table else None
 
-    db_list = fetch_table_schemas(host, user, password, port)
+    # With filter_db only check that schema exists, no need to list all schemas
+    db_list = fetch_table_schemas(host, user, password, port, only_db=filter_db)
     routine_load_infos = fetch_routine_load_info(host, user, password, db_list, port, filter_db, filter_table)
     dbtable_to_names = get_dbtable_to_names(routine_load_infos)
 
     if mode == "1":
         result = generate_pause_resume_sql(dbtable_to_names, filter_db=filter_db, filter_table=filter_table)
-        for dbtable, names, pause_sqls, resume_sqls in result:
+        for (db, table), names, pause_sqls, resume_sqls in result:
             # 展示表名: routine load名字（逗号分隔）
-            print(f"{dbtable}: {', '.join(names)}")
+            print(f"{db}.{table}: {', '.join(names)}")
             # 如果只有一个routine load
             if len(names) == 1:
                 print(pause_sqls[0])
@@ -266,13 +456,17 @@ def main():
             print("")  # 空行分隔
     elif mode == "2":
         print("Getting routine load create statements...")
-        create_sqls_dict = get_routine_load_create_sqls_with_offsets(host, user, password, port, routine_load_infos)
-        all_sqls = []
+        create_sqls_dict = get_routine_load_create_sqls_with_offsets(host, user, password, port, routine_load_infos,
+                                                                     filter_db=filter_db, filter_table=filter_table)
+        print("Modified routine load create statements:")
+        first = True
         for db, name_sqls in create_sqls_dict.items():
             for name, sql in name_sqls.items():
-                all_sqls.append(sql.strip())
-        print("Modified routine load create statements:")
-        print("\n----------------------------------\n".join(all_sqls))
+                if not first:
+                    print("\n----------------------------------\n", end="")
+                print(sql.strip(), end="")
+                first = False
+        print()
     else:
         print("Invalid mode number.")
 